@@ -3,6 +3,891 @@ const axios = require('axios');
 const crypto = require('crypto');
 const KlingerOscillator = require('./klinger-oscillator');
 
+const CANDLE_FIELDS = ['timestamp', 'open', 'high', 'low', 'close', 'volume'];
+
+// Convert a raw exchange kline ([openTime, open, high, low, close, volume, ...]) to a candle
+function parseCandle(candle) {
+  return {
+    timestamp: candle[0],
+    open: parseFloat(candle[1]),
+    high: parseFloat(candle[2]),
+    low: parseFloat(candle[3]),
+    close: parseFloat(candle[4]),
+    volume: parseFloat(candle[5])
+  };
+}
+
+// Fixed-capacity candle store keyed by timestamp, with one typed column per field.
+// Every column is mirrored (slot i is also written at i + capacity), so the newest
+// n candles are always one contiguous range and window() can hand out subarray
+// views instead of copying. Any timestamp-keyed series (e.g. indicator values)
+// can be stored by passing its own field list, which must include 'timestamp'.
+class CandleRingBuffer {
+  constructor(capacity, fields = CANDLE_FIELDS) {
+    this.capacity = capacity;
+    this.fields = fields;
+    this.start = 0;
+    this.length = 0;
+    this.slots = new Map(); // timestamp -> slot
+    this.cachedWindow = null;
+    this.objects = null; // slot -> candle object, maintained once view() is first used
+    this.cachedView = null;
+    
+    this.columns = fields.map(field => {
+      this[field] = new Float64Array(capacity * 2);
+      return this[field];
+    });
+  }
+
+  slotAt(i) {
+    return (this.start + i) % this.capacity;
+  }
+
+  write(slot, candle) {
+    for (let i = 0; i < this.columns.length; i++) {
+      const value = candle[this.fields[i]];
+      this.columns[i][slot] = value;
+      this.columns[i][slot + this.capacity] = value;
+    }
+    
+    if (this.objects) this.objects[slot] = this.read(slot);
+  }
+
+  // Insert a new candle or overwrite the one with the same timestamp.
+  // Returns 'appended', 'updated' or 'ignored' (older than anything we still hold).
+  upsert(candle) {
+    if (this.length > 0) {
+      const lastTimestamp = this.last('timestamp');
+      
+      // Fast path: revision of the newest candle
+      if (candle.timestamp === lastTimestamp) {
+        this.write(this.slotAt(this.length - 1), candle);
+        return 'updated';
+      }
+      
+      if (candle.timestamp < lastTimestamp) {
+        const existingSlot = this.slots.get(candle.timestamp);
+        if (existingSlot === undefined) return 'ignored';
+        this.write(existingSlot, candle);
+        return 'updated';
+      }
+    }
+    
+    if (this.length === this.capacity) {
+      // Evict the oldest candle
+      this.slots.delete(this.timestamp[this.start]);
+      this.start = (this.start + 1) % this.capacity;
+      this.length--;
+    }
+    
+    const slot = this.slotAt(this.length);
+    this.write(slot, candle);
+    this.slots.set(candle.timestamp, slot);
+    this.length++;
+    return 'appended';
+  }
+
+  clear() {
+    this.start = 0;
+    this.length = 0;
+    this.slots.clear();
+  }
+
+  // Value of a field for the newest candle
+  last(field) {
+    return this[field][this.slotAt(this.length - 1)];
+  }
+
+  read(slot) {
+    const candle = {};
+    for (const field of this.fields) {
+      candle[field] = this[field][slot];
+    }
+    return candle;
+  }
+
+  get(i) {
+    return this.read(this.slotAt(i));
+  }
+
+  latest() {
+    return this.length > 0 ? this.get(this.length - 1) : null;
+  }
+
+  // Zero-copy view over the newest n candles, oldest first
+  window(n = this.length) {
+    const size = Math.min(n, this.length);
+    const begin = this.slotAt(this.length - size);
+    
+    // Views share the columns' memory, so the last one stays valid while its range does
+    const cached = this.cachedWindow;
+    if (cached && cached.begin === begin && cached.view.length === size) {
+      return cached.view;
+    }
+    
+    const view = { length: size };
+    for (let i = 0; i < this.columns.length; i++) {
+      view[this.fields[i]] = this.columns[i].subarray(begin, begin + size);
+    }
+    this.cachedWindow = { begin, view };
+    return view;
+  }
+
+  // Live, read-only array of candle objects, oldest first. Objects are kept per
+  // slot like the columns, so neither appends nor reads copy the whole buffer;
+  // indexing, length, iteration and the usual Array methods go through the ring.
+  view() {
+    if (this.cachedView) return this.cachedView;
+    
+    this.objects = new Array(this.capacity);
+    for (let i = 0; i < this.length; i++) {
+      this.objects[this.slotAt(i)] = this.get(i);
+    }
+    
+    const buffer = this;
+    const indexOf = key => {
+      if (typeof key !== 'string') return -1;
+      const i = Number(key);
+      return Number.isInteger(i) && i >= 0 && String(i) === key ? i : -1;
+    };
+    
+    this.cachedView = new Proxy([], {
+      get(target, key, receiver) {
+        if (key === 'length') return buffer.length;
+        const i = indexOf(key);
+        if (i !== -1) return i < buffer.length ? buffer.objects[buffer.slotAt(i)] : undefined;
+        return Reflect.get(target, key, receiver);
+      },
+      has(target, key) {
+        const i = indexOf(key);
+        return i !== -1 ? i < buffer.length : Reflect.has(target, key);
+      },
+      set() {
+        return false;
+      }
+    });
+    return this.cachedView;
+  }
+
+  // Snapshot copy; prefer view() on hot paths
+  toArray() {
+    return Array.from(this.view());
+  }
+}
+
+const KLINGER_FIELDS = ['timestamp', 'klingerOscillator', 'signalLine', 'histogram'];
+
+// Streaming Klinger Volume Oscillator. The state after the last closed candle is
+// kept separately from the state that includes the in-progress candle, so a
+// revision of that candle only re-runs the last step and a new candle costs O(1).
+class KlingerState {
+  constructor({ shortPeriod, longPeriod, signalPeriod }, capacity) {
+    this.shortAlpha = 2 / (shortPeriod + 1);
+    this.longAlpha = 2 / (longPeriod + 1);
+    this.signalAlpha = 2 / (signalPeriod + 1);
+    this.series = new CandleRingBuffer(capacity, KLINGER_FIELDS);
+    this.reset();
+  }
+
+  reset() {
+    this.committed = null; // state after the last closed candle
+    this.current = null; // state including the in-progress candle
+    this.series.clear();
+  }
+
+  static ema(previous, value, alpha) {
+    return previous === null ? value : previous + alpha * (value - previous);
+  }
+
+  step(prev, candle) {
+    const hlc = candle.high + candle.low + candle.close;
+    const dm = candle.high - candle.low;
+    
+    if (prev === null) {
+      return {
+        hlc, dm, cm: dm, trend: 0,
+        emaShort: null, emaLong: null, signal: null,
+        klingerOscillator: 0, signalLine: 0, histogram: 0
+      };
+    }
+    
+    const trend = hlc > prev.hlc ? 1 : -1;
+    const cm = trend === prev.trend ? prev.cm + dm : prev.dm + dm;
+    const volumeForce = cm === 0 ? 0 : candle.volume * Math.abs(2 * (dm / cm) - 1) * trend * 100;
+    
+    const emaShort = KlingerState.ema(prev.emaShort, volumeForce, this.shortAlpha);
+    const emaLong = KlingerState.ema(prev.emaLong, volumeForce, this.longAlpha);
+    const klingerOscillator = emaShort - emaLong;
+    const signal = KlingerState.ema(prev.signal, klingerOscillator, this.signalAlpha);
+    
+    return {
+      hlc, dm, cm, trend,
+      emaShort, emaLong, signal,
+      klingerOscillator, signalLine: signal, histogram: klingerOscillator - signal
+    };
+  }
+
+  // status is the CandleRingBuffer.upsert() result for the newest candle
+  update(candle, status) {
+    if (status === 'appended') {
+      this.committed = this.current;
+    } else if (status !== 'updated') {
+      return;
+    }
+    
+    this.current = this.step(this.committed, candle);
+    this.series.upsert({
+      timestamp: candle.timestamp,
+      klingerOscillator: this.current.klingerOscillator,
+      signalLine: this.current.signalLine,
+      histogram: this.current.histogram
+    });
+  }
+
+  // Same shape as KlingerOscillator.calculate(), as zero-copy views
+  result() {
+    return this.series.window();
+  }
+}
+
+// Monotonic deque giving the max (or min) of the last `period` pushed values
+class RollingExtreme {
+  constructor(period, isMax) {
+    this.period = period;
+    this.sign = isMax ? 1 : -1;
+    this.values = new Float64Array(period);
+    this.sequences = new Float64Array(period);
+    this.reset();
+  }
+
+  reset() {
+    this.head = 0;
+    this.size = 0;
+    this.sequence = 0;
+  }
+
+  push(value) {
+    const signed = value * this.sign;
+    
+    // Drop the front once it falls out of the window
+    if (this.size > 0 && this.sequences[this.head] <= this.sequence - this.period) {
+      this.head = (this.head + 1) % this.period;
+      this.size--;
+    }
+    
+    // Drop values that can no longer be the extreme
+    while (this.size > 0 && this.values[(this.head + this.size - 1) % this.period] <= signed) {
+      this.size--;
+    }
+    
+    const slot = (this.head + this.size) % this.period;
+    this.values[slot] = signed;
+    this.sequences[slot] = this.sequence++;
+    this.size++;
+  }
+
+  value() {
+    return this.size > 0 ? this.values[this.head] * this.sign : NaN;
+  }
+}
+
+// Streaming support/resistance and ATR. Closed candles are folded into the rolling
+// windows once; the in-progress candle is only combined in at read time, so
+// revising it never has to undo anything.
+class DynamicLevelTracker {
+  constructor({ levelPeriod, atrPeriod }) {
+    this.atrPeriod = atrPeriod;
+    this.resistance = new RollingExtreme(levelPeriod, true);
+    this.support = new RollingExtreme(levelPeriod, false);
+    this.reset();
+  }
+
+  reset() {
+    this.resistance.reset();
+    this.support.reset();
+    this.atr = null;
+    this.previousClose = null;
+    this.live = null;
+  }
+
+  trueRange(candle) {
+    if (this.previousClose === null) return candle.high - candle.low;
+    return Math.max(
+      candle.high - candle.low,
+      Math.abs(candle.high - this.previousClose),
+      Math.abs(candle.low - this.previousClose)
+    );
+  }
+
+  smoothAtr(trueRange) {
+    return this.atr === null ? trueRange : (this.atr * (this.atrPeriod - 1) + trueRange) / this.atrPeriod;
+  }
+
+  // status is the CandleRingBuffer.upsert() result for the newest candle
+  update(candle, status) {
+    if (status === 'appended' && this.live) {
+      // The previous in-progress candle is now closed
+      this.resistance.push(this.live.high);
+      this.support.push(this.live.low);
+      this.atr = this.smoothAtr(this.trueRange(this.live));
+      this.previousClose = this.live.close;
+    } else if (status !== 'appended' && status !== 'updated') {
+      return;
+    }
+    
+    this.live = { high: candle.high, low: candle.low, close: candle.close };
+  }
+
+  levels() {
+    if (!this.live) return null;
+    
+    const resistance = this.resistance.size > 0 ? Math.max(this.resistance.value(), this.live.high) : this.live.high;
+    const support = this.support.size > 0 ? Math.min(this.support.value(), this.live.low) : this.live.low;
+    
+    return {
+      support,
+      resistance,
+      atr: this.smoothAtr(this.trueRange(this.live))
+    };
+  }
+}
+
+// Binance request weight of GET /api/v3/klines for a given limit
+function klineRequestWeight(limit) {
+  if (limit < 100) return 1;
+  if (limit < 500) return 2;
+  if (limit < 1000) return 5;
+  return 10;
+}
+
+// Token bucket shared by every request to one exchange. Requests wait in FIFO
+// order until enough weight has refilled, so bursts are spread out instead of
+// tripping the exchange limit.
+class TokenBucket {
+  constructor({ capacity, refillPerSecond }) {
+    this.capacity = capacity;
+    this.refillPerSecond = refillPerSecond;
+    this.tokens = capacity;
+    this.lastRefill = Date.now();
+    this.queue = [];
+    this.timer = null;
+  }
+
+  refill() {
+    const now = Date.now();
+    this.tokens = Math.min(this.capacity, this.tokens + (now - this.lastRefill) / 1000 * this.refillPerSecond);
+    this.lastRefill = now;
+  }
+
+  schedule(weight, task) {
+    return new Promise((resolve, reject) => {
+      this.queue.push({ weight: Math.min(weight, this.capacity), task, resolve, reject });
+      this.drain();
+    });
+  }
+
+  drain() {
+    this.refill();
+    
+    while (this.queue.length > 0 && this.tokens >= this.queue[0].weight) {
+      const { weight, task, resolve, reject } = this.queue.shift();
+      this.tokens -= weight;
+      Promise.resolve().then(task).then(resolve, reject);
+    }
+    
+    if (this.queue.length > 0 && !this.timer) {
+      const wait = (this.queue[0].weight - this.tokens) / this.refillPerSecond * 1000;
+      this.timer = setTimeout(() => {
+        this.timer = null;
+        this.drain();
+      }, Math.ceil(wait));
+    }
+  }
+}
+
+// One kline websocket serving any number of bots through a combined stream,
+// with exponential-backoff reconnects. A socket that goes quiet for
+// staleTimeoutMs is treated as half-open and replaced. Bots are notified
+// through onStreamOpen/onStreamClose/onStreamCandle.
+class KlineStream {
+  constructor(baseUrl, bots, { reconnectDelayMs = 1000, maxReconnectDelayMs = 60000, staleTimeoutMs = 60000 } = {}) {
+    this.baseUrl = baseUrl;
+    this.bots = new Map(bots.map(bot => [bot.streamName, bot]));
+    this.reconnectDelayMs = reconnectDelayMs;
+    this.maxReconnectDelayMs = maxReconnectDelayMs;
+    this.staleTimeoutMs = staleTimeoutMs;
+    this.socket = null;
+    this.stopped = false;
+    this.reconnectAttempts = 0;
+    this.reconnectTimer = null;
+    this.watchdog = null;
+  }
+
+  // Restart the no-message timer; called on open and on every message or ping
+  armWatchdog(socket) {
+    clearTimeout(this.watchdog);
+    this.watchdog = setTimeout(() => {
+      console.error(`No kline messages for ${this.staleTimeoutMs}ms, reconnecting`);
+      this.forceReconnect(socket);
+    }, this.staleTimeoutMs);
+  }
+
+  // Drop the socket without a close handshake (which a half-open peer never answers);
+  // the 'close' handler then schedules the reconnect
+  forceReconnect(socket) {
+    if (socket !== this.socket) return;
+    if (socket.terminate) {
+      socket.terminate();
+    } else {
+      socket.close();
+    }
+  }
+
+  connect() {
+    // Only needed in stream mode
+    const WebSocket = require('ws');
+    const url = `${this.baseUrl}/stream?streams=${[...this.bots.keys()].join('/')}`;
+    
+    this.stopped = false;
+    const socket = new WebSocket(url);
+    this.socket = socket;
+    
+    socket.on('open', () => {
+      console.log(`Kline stream connected for ${this.bots.size} symbol(s)`);
+      this.armWatchdog(socket);
+      
+      // A bot whose backfill fails stays on REST polling and retries on its own;
+      // the socket and the other bots are left alone
+      const backfills = [...this.bots.values()].map(bot => bot.onStreamOpen().then(() => true, () => false));
+      
+      // The connection only counts as healthy (and the backoff is reset) once every
+      // bot is caught up
+      Promise.all(backfills).then(results => {
+        if (socket === this.socket && results.every(Boolean)) {
+          this.reconnectAttempts = 0;
+        }
+      });
+    });
+    
+    socket.on('ping', () => this.armWatchdog(socket));
+    
+    socket.on('message', data => {
+      this.armWatchdog(socket);
+      try {
+        this.handleMessage(data);
+      } catch (error) {
+        console.error('Error handling kline message:', error.message);
+      }
+    });
+    
+    socket.on('error', error => {
+      console.error('Kline stream error:', error.message);
+    });
+    
+    socket.on('close', () => {
+      if (this.socket === socket) clearTimeout(this.watchdog);
+      for (const bot of this.bots.values()) {
+        bot.onStreamClose();
+      }
+      if (this.socket === socket) this.socket = null;
+      if (this.stopped) return;
+      
+      // Exponential backoff; REST polling covers the cycles in between
+      const delay = Math.min(this.reconnectDelayMs * 2 ** this.reconnectAttempts, this.maxReconnectDelayMs);
+      this.reconnectAttempts++;
+      console.log(`Kline stream closed, reconnecting in ${delay}ms`);
+      this.reconnectTimer = setTimeout(() => this.connect(), delay);
+    });
+  }
+
+  close() {
+    this.stopped = true;
+    clearTimeout(this.reconnectTimer);
+    clearTimeout(this.watchdog);
+    if (this.socket) {
+      this.socket.close();
+      this.socket = null;
+    }
+  }
+
+  handleMessage(data) {
+    const message = JSON.parse(data.toString());
+    // Combined streams wrap the event in { stream, data }, raw streams send it directly
+    const kline = (message.data || message).k;
+    if (!kline) return;
+    
+    const bot = this.bots.get(`${kline.s.toLowerCase()}@kline_${kline.i}`);
+    if (!bot) return;
+    
+    bot.onStreamCandle(parseCandle([kline.t, kline.o, kline.h, kline.l, kline.c, kline.v]));
+  }
+}
+
+// Runs a task a fixed offset after every candle close on the exchange clock.
+// The next fire time is recomputed from the clock each time, so timers do not
+// drift; a close that arrives while the previous cycle is still running is
+// coalesced into one follow-up run instead of overlapping it.
+class CandleCloseScheduler {
+  constructor({ intervalMs, offsetMs = 1000, now = Date.now, task }) {
+    this.intervalMs = intervalMs;
+    this.offsetMs = offsetMs;
+    this.now = now;
+    this.task = task;
+    this.timer = null;
+    this.stopped = true;
+    this.running = false;
+    this.pendingCloseTime = null;
+    
+    // Lag between candle close and the end of the decision cycle
+    this.stats = { cycles: 0, coalesced: 0, lastLagMs: null, maxLagMs: 0, meanLagMs: 0 };
+  }
+
+  start() {
+    this.stopped = false;
+    this.scheduleNext();
+  }
+
+  stop() {
+    this.stopped = true;
+    clearTimeout(this.timer);
+    this.timer = null;
+  }
+
+  scheduleNext() {
+    if (this.stopped) return;
+    
+    const now = this.now();
+    let closeTime = Math.floor(now / this.intervalMs) * this.intervalMs;
+    if (closeTime + this.offsetMs <= now) closeTime += this.intervalMs;
+    
+    this.timer = setTimeout(() => this.fire(closeTime), closeTime + this.offsetMs - now);
+  }
+
+  async fire(closeTime) {
+    this.scheduleNext();
+    
+    if (this.running) {
+      // Only the latest missed close is worth a run
+      if (this.pendingCloseTime !== null) this.stats.coalesced++;
+      this.pendingCloseTime = closeTime;
+      return;
+    }
+    
+    await this.run(closeTime);
+  }
+
+  // Run immediately outside the candle-close cadence (e.g. on startup); not counted in lag stats
+  async runNow() {
+    if (this.running) return;
+    await this.run(null);
+  }
+
+  async run(closeTime) {
+    this.running = true;
+    try {
+      await this.task(closeTime);
+    } catch (error) {
+      console.error('Error in trading cycle:', error.message);
+    } finally {
+      if (closeTime !== null) this.recordLag(this.now() - closeTime);
+      this.running = false;
+    }
+    
+    if (this.pendingCloseTime !== null) {
+      const pending = this.pendingCloseTime;
+      this.pendingCloseTime = null;
+      await this.run(pending);
+    }
+  }
+
+  recordLag(lagMs) {
+    const stats = this.stats;
+    stats.cycles++;
+    stats.lastLagMs = lagMs;
+    stats.maxLagMs = Math.max(stats.maxLagMs, lagMs);
+    stats.meanLagMs += (lagMs - stats.meanLagMs) / stats.cycles;
+  }
+}
+
+// Run worker over items with at most `limit` in flight; results have the
+// Promise.allSettled shape, in input order
+async function settleWithConcurrency(items, limit, worker) {
+  const results = new Array(items.length);
+  let next = 0;
+  
+  const run = async () => {
+    while (next < items.length) {
+      const i = next++;
+      try {
+        results[i] = { status: 'fulfilled', value: await worker(items[i]) };
+      } catch (reason) {
+        results[i] = { status: 'rejected', reason };
+      }
+    }
+  };
+  
+  await Promise.all(Array.from({ length: Math.min(limit, items.length) }, run));
+  return results;
+}
+
+// Open positions with price-sorted stop-loss and take-profit indexes. Stops are
+// kept ascending and take-profits descending, so the levels crossed by a price
+// are always at the tail and a tick only touches the positions it triggers.
+// Index entries of removed positions are dropped lazily.
+class PositionBook {
+  constructor() {
+    this.positions = new Map(); // key -> position
+    this.stopLosses = []; // { price, key }, ascending
+    this.takeProfits = []; // { price, key }, descending
+    this.nextKey = 0;
+  }
+
+  get size() {
+    return this.positions.size;
+  }
+
+  values() {
+    return this.positions.values();
+  }
+
+  static insert(index, entry, descending) {
+    let low = 0;
+    let high = index.length;
+    while (low < high) {
+      const mid = (low + high) >>> 1;
+      const before = descending ? index[mid].price >= entry.price : index[mid].price <= entry.price;
+      if (before) low = mid + 1;
+      else high = mid;
+    }
+    index.splice(low, 0, entry);
+  }
+
+  add(position) {
+    const key = this.nextKey++;
+    this.positions.set(key, position);
+    PositionBook.insert(this.stopLosses, { price: position.stopLoss, key }, false);
+    PositionBook.insert(this.takeProfits, { price: position.takeProfit, key }, true);
+  }
+
+  // Remove and return the positions whose stop loss or take profit `price` crossed
+  popTriggered(price) {
+    const triggered = [];
+    
+    const popWhile = (index, crossed, reason) => {
+      while (index.length > 0 && crossed(index[index.length - 1].price)) {
+        const { key } = index.pop();
+        const position = this.positions.get(key);
+        if (position) {
+          this.positions.delete(key);
+          triggered.push({ position, reason });
+        }
+      }
+    };
+    
+    popWhile(this.stopLosses, stopLoss => price <= stopLoss, 'stop loss');
+    popWhile(this.takeProfits, takeProfit => price >= takeProfit, 'take profit');
+    this.compact();
+    
+    return triggered;
+  }
+
+  // Remove and return every open position
+  takeAll() {
+    const positions = [...this.positions.values()];
+    this.positions.clear();
+    this.stopLosses = [];
+    this.takeProfits = [];
+    return positions;
+  }
+
+  compact() {
+    const live = entry => this.positions.has(entry.key);
+    if (this.stopLosses.length > 2 * this.positions.size + 32) {
+      this.stopLosses = this.stopLosses.filter(live);
+    }
+    if (this.takeProfits.length > 2 * this.positions.size + 32) {
+      this.takeProfits = this.takeProfits.filter(live);
+    }
+  }
+}
+
+// Convert an interval string ('15m', '4h', '1d') to milliseconds
+function intervalToMs(interval) {
+  const unit = interval.slice(-1);
+  const value = parseInt(interval.slice(0, -1));
+  
+  switch (unit) {
+    case 'm': return value * 60 * 1000;
+    case 'h': return value * 60 * 60 * 1000;
+    case 'd': return value * 24 * 60 * 60 * 1000;
+    default: return 60 * 1000; // default to 1 minute
+  }
+}
+
+// Higher-timeframe candles built from the base-interval stream, with their own
+// Klinger state and dynamic levels. Buckets are aligned to UTC epoch multiples,
+// like the exchange's own candles. Closed base candles are folded into the
+// bucket once and the in-progress base candle is merged on top, so each base
+// update costs O(1) and revisions never have to be undone. History is seeded
+// once from the exchange at load; `ready` tells whether there is enough of it.
+class HigherTimeframe {
+  constructor(interval, { capacity, minDataPoints, klinger, levels }) {
+    this.interval = interval;
+    this.intervalMs = intervalToMs(interval);
+    this.minDataPoints = minDataPoints;
+    this.candles = new CandleRingBuffer(capacity);
+    this.klingerState = new KlingerState(klinger, capacity);
+    this.levelTracker = new DynamicLevelTracker(levels);
+    this.reset();
+  }
+
+  reset() {
+    this.candles.clear();
+    this.klingerState.reset();
+    this.levelTracker.reset();
+    this.closed = null; // aggregate of the closed base candles in the newest bucket
+    this.live = null; // in-progress base candle
+    this.skipUntil = null; // start of the first bucket we can aggregate completely
+  }
+
+  get ready() {
+    return this.skipUntil === null && this.candles.length >= this.minDataPoints;
+  }
+
+  bucketOf(timestamp) {
+    return Math.floor(timestamp / this.intervalMs) * this.intervalMs;
+  }
+
+  // Start of the in-progress bucket when the base buffer does not reach back to it
+  // (the caller then fetches the base candles in between), otherwise null
+  uncoveredBucket(baseCandles) {
+    if (baseCandles.length === 0) return null;
+    const currentBucket = this.bucketOf(baseCandles.last('timestamp'));
+    return baseCandles.get(0).timestamp > currentBucket ? currentBucket : null;
+  }
+
+  // Replace the history with the exchange's closed candles for this interval, then
+  // build the in-progress bucket from the base candles so streaming picks up from there.
+  // prefix holds the base candles between the bucket start and the base buffer
+  // (see uncoveredBucket()); null if they could not be fetched, in which case the
+  // in-progress bucket is skipped and the timeframe is not ready until the next one.
+  seed(klines, baseCandles, prefix = []) {
+    if (baseCandles.length === 0) return;
+    
+    const currentBucket = this.bucketOf(baseCandles.last('timestamp'));
+    this.reset();
+    
+    // The exchange's in-progress candle is left out; it is rebuilt from base candles below
+    for (const raw of klines) {
+      const candle = parseCandle(raw);
+      if (candle.timestamp >= currentBucket) break;
+      const status = this.candles.upsert(candle);
+      this.klingerState.update(candle, status);
+      this.levelTracker.update(candle, status);
+    }
+    
+    if (!prefix) {
+      console.warn(`Base history does not reach the start of the current ${this.interval} candle; waiting for the next one`);
+      this.skipUntil = currentBucket + this.intervalMs;
+    } else {
+      for (const base of prefix) {
+        this.update(base, 'appended');
+      }
+    }
+    
+    for (let i = 0; i < baseCandles.length; i++) {
+      const base = baseCandles.get(i);
+      if (base.timestamp >= currentBucket) this.update(base, 'appended');
+    }
+  }
+
+  static merge(aggregate, candle) {
+    return {
+      timestamp: aggregate.timestamp,
+      open: aggregate.open,
+      high: Math.max(aggregate.high, candle.high),
+      low: Math.min(aggregate.low, candle.low),
+      close: candle.close,
+      volume: aggregate.volume + candle.volume
+    };
+  }
+
+  // status is the CandleRingBuffer.upsert() result for the newest base candle
+  update(candle, status) {
+    if (this.skipUntil !== null) {
+      if (candle.timestamp < this.skipUntil) return;
+      this.skipUntil = null;
+      this.live = null; // the skipped bucket must not be folded into the next one
+    }
+    
+    if (status === 'appended' && this.live) {
+      const bucket = this.bucketOf(this.live.timestamp);
+      this.closed = this.closed && this.closed.timestamp === bucket
+        ? HigherTimeframe.merge(this.closed, this.live)
+        : { ...this.live, timestamp: bucket };
+    } else if (status !== 'appended' && status !== 'updated') {
+      return;
+    }
+    this.live = candle;
+    
+    const bucket = this.bucketOf(candle.timestamp);
+    const aggregate = this.closed && this.closed.timestamp === bucket
+      ? HigherTimeframe.merge(this.closed, candle)
+      : { ...candle, timestamp: bucket };
+    
+    const aggregateStatus = this.candles.upsert(aggregate);
+    this.klingerState.update(aggregate, aggregateStatus);
+    this.levelTracker.update(aggregate, aggregateStatus);
+  }
+
+  // An already-closed base candle was revised: re-aggregate only its bucket from
+  // the base buffer. Buckets the base buffer no longer fully covers are left as they are.
+  revise(candle, baseCandles) {
+    const bucket = this.bucketOf(candle.timestamp);
+    if (baseCandles.length === 0 || baseCandles.get(0).timestamp > bucket) return;
+    
+    const liveBucket = this.live ? this.bucketOf(this.live.timestamp) : null;
+    let aggregate = null;
+    for (let i = 0; i < baseCandles.length; i++) {
+      const base = baseCandles.get(i);
+      if (base.timestamp < bucket) continue;
+      if (base.timestamp >= bucket + this.intervalMs) break;
+      if (bucket === liveBucket && base.timestamp >= this.live.timestamp) break;
+      aggregate = aggregate ? HigherTimeframe.merge(aggregate, base) : { ...base, timestamp: bucket };
+    }
+    
+    if (bucket === liveBucket) {
+      // Newest bucket: fix the closed part and re-apply the in-progress candle
+      this.closed = aggregate;
+      const live = this.live;
+      this.update(live, 'updated');
+      return;
+    }
+    
+    if (!aggregate || this.candles.upsert(aggregate) !== 'updated') return;
+    
+    // An older higher-timeframe candle changed; replay this timeframe's indicators
+    // over its own (longer) history
+    this.klingerState.reset();
+    this.levelTracker.reset();
+    for (let i = 0; i < this.candles.length; i++) {
+      const htfCandle = this.candles.get(i);
+      this.klingerState.update(htfCandle, 'appended');
+      this.levelTracker.update(htfCandle, 'appended');
+    }
+  }
+
+  context() {
+    return {
+      interval: this.interval,
+      ready: this.ready,
+      candles: this.candles.view(),
+      klinger: this.klingerState.result(),
+      levels: this.levelTracker.levels()
+    };
+  }
+}
+
 class CryptoTradingBot {
   constructor(config) {
     this.exchange = config.exchange;
@@ -11,7 +896,6 @@ class CryptoTradingBot {
     this.symbol = config.symbol; // e.g., 'BTCUSDT'
     this.interval = config.interval; // e.g., '1h'
     this.lastSignal = null;
-    this.historicalData = [];
     
     // Initialize Klinger Oscillator with configuration
     this.klingerOscillator = new KlingerOscillator({
@@ -26,13 +910,83 @@ class CryptoTradingBot {
       100 // Ensure we have enough data for reliable signals
     );
     
+    // Candle history, oldest candles are evicted once capacity is reached
+    this.candles = new CandleRingBuffer(config.candleCapacity || this.minDataPoints);
+    
+    // Indicator state updated per candle rather than recalculated over the full history
+    this.klingerState = new KlingerState(this.klingerOscillator, this.candles.capacity);
+    this.levelTracker = new DynamicLevelTracker({
+      levelPeriod: config.levelPeriod || 20,
+      atrPeriod: config.atrPeriod || 14
+    });
+    
+    // Optional higher timeframes (e.g. ['4h', '1d']) aggregated from the base
+    // candles; each costs one request at load to seed its history, none per cycle
+    const baseIntervalMs = intervalToMs(this.interval);
+    this.timeframes = [];
+    for (const interval of config.timeframes || []) {
+      const intervalMs = intervalToMs(interval);
+      if (intervalMs <= baseIntervalMs || intervalMs % baseIntervalMs !== 0) {
+        console.warn(`Skipping timeframe ${interval}: must be a larger multiple of ${this.interval}`);
+        continue;
+      }
+      this.timeframes.push(new HigherTimeframe(interval, {
+        capacity: Math.max(config.timeframeCapacity || 0, this.minDataPoints),
+        minDataPoints: this.minDataPoints,
+        klinger: this.klingerOscillator,
+        levels: {
+          levelPeriod: config.levelPeriod || 20,
+          atrPeriod: config.atrPeriod || 14
+        }
+      }));
+    }
+    
     // Risk management
     this.maxPositionSize = config.maxPositionSize || 0.1; // Maximum portion of balance to use
     this.stopLossPercent = config.stopLossPercent || 0.03; // 3% stop loss
     this.takeProfitPercent = config.takeProfitPercent || 0.06; // 6% take profit
     
     // Track positions
-    this.positions = [];
+    this.positions = new PositionBook();
+    this.orderConcurrency = config.orderConcurrency || 5; // Exit orders in flight at once
+    
+    // Data source: 'rest' polls the klines endpoint each cycle, 'stream' consumes
+    // pushed kline updates and only falls back to REST for backfill
+    this.dataMode = config.dataMode || 'rest';
+    this.restBaseUrl = config.restBaseUrl || 'https://api.binance.com';
+    this.streamBaseUrl = config.streamBaseUrl || 'wss://stream.binance.com:9443';
+    this.reconnectDelayMs = config.reconnectDelayMs || 1000;
+    this.maxReconnectDelayMs = config.maxReconnectDelayMs || 60000;
+    this.streamStaleTimeoutMs = config.streamStaleTimeoutMs || 60000;
+    this.backfillAttempts = config.backfillAttempts || 3;
+    this.stream = null;
+    this.streamConnected = false;
+    this.streamGeneration = 0; // bumped on every close, so a late backfill can't revive a dead socket
+    this.backfilling = false;
+    this.pendingStreamCandles = [];
+    this.backfillRetries = 0;
+    this.backfillRetryTimer = null;
+    
+    // HTTP client and request scheduler, shared across bots when run by CryptoTradingBotHost
+    this.http = config.httpClient || axios;
+    this.rateLimiter = config.rateLimiter || null;
+    
+    // Cycles run this long after each candle close on the exchange clock
+    this.cycleOffsetMs = config.cycleOffsetMs || 1000;
+    this.clockOffsetMs = 0; // exchange time - local time
+    this.clock = config.clock || Date.now; // replaced by a virtual clock in replay mode
+    this.scheduler = null;
+    this.holdFrom = null; // candles opening at or after this wait for the close before them to be decided
+    this.heldCandles = [];
+    
+    // Local matching simulator that fills orders in replay mode
+    this.exchangeSimulator = config.exchangeSimulator || null;
+    this.logState = config.logState !== false;
+  }
+
+  // Materialized candle objects, for consumers that need an array of candles
+  get historicalData() {
+    return this.candles.view();
   }
 
   async start() {
@@ -42,126 +996,438 @@ class CryptoTradingBot {
     // Initial data load
     try {
       await this.loadHistoricalData();
-      console.log(`Loaded ${this.historicalData.length} historical data points`);
+      console.log(`Loaded ${this.candles.length} historical data points`);
     } catch (error) {
       console.error('Failed to load historical data:', error.message);
       return;
     }
     
-    // Set up recurring check
-    setInterval(async () => {
-      try {
-        await this.checkAndTrade();
-      } catch (error) {
-        console.error('Error in trading cycle:', error.message);
-      }
-    }, this.getIntervalInMs());
+    if (this.dataMode === 'stream') {
+      this.startStream();
+    }
+    
+    // Set up recurring check, aligned to candle closes
+    await this.syncExchangeClock();
+    this.scheduler = new CandleCloseScheduler({
+      intervalMs: this.getIntervalInMs(),
+      offsetMs: this.cycleOffsetMs,
+      now: () => this.exchangeNow(),
+      task: closeTime => this.checkAndTrade(closeTime)
+    });
+    this.scheduler.start();
     
     // Initial check
-    await this.checkAndTrade();
+    await this.scheduler.runNow();
   }
 
-  async loadHistoricalData() {
-    // Load enough historical data for our calculations
-    const response = await this.fetchCandlestickData(this.minDataPoints);
-    
-    this.historicalData = response.map(candle => ({
-      timestamp: candle[0],
-      open: parseFloat(candle[1]),
-      high: parseFloat(candle[2]),
-      low: parseFloat(candle[3]),
-      close: parseFloat(candle[4]),
-      volume: parseFloat(candle[5])
-    }));
+  exchangeNow() {
+    return this.clock() + this.clockOffsetMs;
   }
 
-  async checkAndTrade() {
-    // 1. Update data with the latest candle
-    await this.updateLatestData();
-    
-    // 2. Calculate Klinger Oscillator
+  async syncExchangeClock() {
     try {
-      const klingerResult = this.klingerOscillator.calculate(this.historicalData);
+      const request = () => this.http.get(`${this.restBaseUrl}/api/v3/time`);
+      const sentAt = Date.now();
+      const response = this.rateLimiter
+        ? await this.rateLimiter.schedule(1, request)
+        : await request();
+      const receivedAt = Date.now();
       
-      // 3. Generate signal based on Klinger Oscillator with critical levels
-      const signalData = this.klingerOscillator.generateSignal(klingerResult, this.historicalData);
-      
-      // 4. Execute trades based on signal
-      if (signalData && signalData.signal !== this.lastSignal) {
-        // Calculate dynamic levels for better trade management
-        const enhancedLevels = this.klingerOscillator.calculateDynamicLevels(
-          signalData.criticalLevels, 
-          this.historicalData
-        );
-        
-        await this.executeTrade(signalData.signal, enhancedLevels);
-        this.lastSignal = signalData.signal;
+      const serverTime = response.data && response.data.serverTime;
+      if (!Number.isFinite(serverTime)) {
+        throw new Error('Invalid server time response');
       }
       
-      // 5. Check and manage existing positions using critical levels
-      await this.managePositionsWithLevels();
-      
-      // 6. Log current state
-      this.logCurrentState(klingerResult, signalData);
+      // Assume the server read its clock halfway through the round trip
+      this.clockOffsetMs = serverTime - (sentAt + receivedAt) / 2;
     } catch (error) {
-      console.error('Error calculating Klinger Oscillator:', error.message);
+      console.error('Error syncing exchange clock, using local time:', error.message);
     }
+    return this.clockOffsetMs;
   }
 
-  async updateLatestData() {
-    // Fetch the latest candle
-    const latestCandles = await this.fetchCandlestickData(2); // Get 2 most recent candles
+  async loadHistoricalData(closeTime = null) {
+    // Load enough historical data for our calculations, and each higher
+    // timeframe's own history in parallel
+    const [response, ...timeframeKlines] = await Promise.all([
+      this.fetchCandlestickData(Math.min(this.candles.capacity, 1000)),
+      ...this.timeframes.map(timeframe =>
+        this.fetchCandlestickData(Math.min(timeframe.candles.capacity + 1, 1000), timeframe.interval)
+          .catch(() => null) // keep the aggregated history; already logged
+      )
+    ]);
+    
+    // Higher timeframes keep their history and only take the base candles
+    // from their in-progress one onwards
+    const resumeFrom = this.timeframes.map(timeframe => timeframe.live ? timeframe.live.timestamp : -Infinity);
     
-    if (latestCandles.length > 0) {
-      const latestCandle = latestCandles[latestCandles.length - 1];
-      const latestTimestamp = latestCandle[0];
+    this.candles.clear();
+    this.resetIndicators();
+    for (const raw of response) {
+      if (closeTime !== null && raw[0] >= closeTime) continue;
+      const candle = parseCandle(raw);
+      if (this.holdCandle(candle)) continue;
+      const status = this.candles.upsert(candle);
+      if (status === 'ignored') continue;
       
-      // Check if we already have this candle
-      const existingIndex = this.historicalData.findIndex(
-        candle => candle.timestamp === latestTimestamp
-      );
+      this.klingerState.update(candle, status);
+      this.levelTracker.update(candle, status);
+      this.timeframes.forEach((timeframe, i) => {
+        if (candle.timestamp >= resumeFrom[i]) {
+          timeframe.update(candle, candle.timestamp === resumeFrom[i] ? 'updated' : 'appended');
+        }
+      });
+    }
+    
+    await Promise.all(this.timeframes.map(async (timeframe, i) => {
+      if (!timeframeKlines[i]) return;
       
-      if (existingIndex >= 0) {
-        // Update existing candle
-        this.historicalData[existingIndex] = {
-          timestamp: latestCandle[0],
-          open: parseFloat(latestCandle[1]),
-          high: parseFloat(latestCandle[2]),
-          low: parseFloat(latestCandle[3]),
-          close: parseFloat(latestCandle[4]),
-          volume: parseFloat(latestCandle[5])
-        };
-      } else {
-        // Add new candle and remove oldest if necessary
-        this.historicalData.push({
-          timestamp: latestCandle[0],
-          open: parseFloat(latestCandle[1]),
-          high: parseFloat(latestCandle[2]),
-          low: parseFloat(latestCandle[3]),
-          close: parseFloat(latestCandle[4]),
-          volume: parseFloat(latestCandle[5])
-        });
+      // A higher-timeframe candle can span more base candles than we keep
+      const bucketStart = timeframe.uncoveredBucket(this.candles);
+      const prefix = bucketStart === null
+        ? []
+        : await this.fetchCandlesBetween(bucketStart, this.candles.get(0).timestamp).catch(() => null);
+      timeframe.seed(timeframeKlines[i], this.candles, prefix);
+    }));
+  }
+
+  // Base candles opening in [startTime, endTime), paged by the endpoint's 1000 limit
+  async fetchCandlesBetween(startTime, endTime) {
+    const intervalMs = this.getIntervalInMs();
+    const candles = [];
+    
+    for (let from = startTime; from < endTime;) {
+      const limit = Math.min(Math.ceil((endTime - from) / intervalMs), 1000);
+      const response = await this.fetchCandlestickData(limit, this.interval, { startTime: from, endTime: endTime - 1 });
+      if (response.length === 0) break; // nothing traded before the listing
+      
+      for (const raw of response) {
+        if (raw[0] >= from && raw[0] < endTime) candles.push(parseCandle(raw));
+      }
+      const next = response[response.length - 1][0] + intervalMs;
+      if (next <= from) break;
+      from = next;
+    }
+    return candles;
+  }
+
+  // Store a candle and advance the indicators by one step
+  ingestCandle(candle) {
+    const isLatest = this.candles.length === 0 || candle.timestamp >= this.candles.last('timestamp');
+    const status = this.candles.upsert(candle);
+    
+    if (status === 'ignored') return status;
+    
+    if (!isLatest) {
+      // An already-closed candle was revised; replay the indicators over the buffer
+      this.rebuildIndicators(candle);
+      return status;
+    }
+    
+    this.updateIndicators(candle, status);
+    return status;
+  }
+
+  updateIndicators(candle, status) {
+    this.klingerState.update(candle, status);
+    this.levelTracker.update(candle, status);
+    for (const timeframe of this.timeframes) {
+      timeframe.update(candle, status);
+    }
+  }
+
+  // Base-interval indicators only; higher timeframes hold more history than the
+  // base buffer and are never reset from it
+  resetIndicators() {
+    this.klingerState.reset();
+    this.levelTracker.reset();
+  }
+
+  rebuildIndicators(revisedCandle) {
+    this.resetIndicators();
+    for (let i = 0; i < this.candles.length; i++) {
+      const candle = this.candles.get(i);
+      this.klingerState.update(candle, 'appended');
+      this.levelTracker.update(candle, 'appended');
+    }
+    for (const timeframe of this.timeframes) {
+      timeframe.revise(revisedCandle, this.candles);
+    }
+  }
+
+  // Klinger values, dynamic levels and candles per higher timeframe, keyed by interval
+  getTimeframeContext() {
+    const context = {};
+    for (const timeframe of this.timeframes) {
+      context[timeframe.interval] = timeframe.context();
+    }
+    return context;
+  }
+
+  // closeTime is the candle close this cycle was scheduled for; the decision is
+  // taken on that closed candle rather than on the period that just opened
+  async checkAndTrade(closeTime = null) {
+    if (closeTime !== null) this.beginDecision(closeTime);
+    
+    try {
+      // 1. Update data with the latest candle, unless the stream (or replay) already pushed it
+      if (this.dataMode !== 'replay' && !this.streamConnected) {
+        await this.updateLatestData(closeTime);
+      }
+      
+      // 2. Read the incrementally maintained Klinger Oscillator
+      try {
+        const klingerResult = this.klingerState.result();
+        const timeframeContext = this.getTimeframeContext();
         
-        // Keep data size manageable
-        if (this.historicalData.length > this.minDataPoints * 1.5) {
-          this.historicalData = this.historicalData.slice(-this.minDataPoints);
+        // 3. Generate signal based on Klinger Oscillator with critical levels
+        // (the KlingerOscillator API takes candle objects, not the buffer's columns)
+        const signalData = this.klingerOscillator.generateSignal(klingerResult, this.historicalData, timeframeContext);
+        
+        // 4. Execute trades based on signal
+        if (signalData && signalData.signal !== this.lastSignal) {
+          // Keep the oscillator's critical levels as they are; the streaming
+          // dynamic levels of every timeframe go under their own keys
+          const higherTimeframeLevels = {};
+          for (const [interval, context] of Object.entries(timeframeContext)) {
+            if (context.ready) higherTimeframeLevels[interval] = context.levels;
+          }
+          const enhancedLevels = {
+            ...signalData.criticalLevels,
+            dynamic: this.levelTracker.levels(),
+            timeframes: higherTimeframeLevels
+          };
+          
+          await this.executeTrade(signalData.signal, enhancedLevels);
+          this.lastSignal = signalData.signal;
         }
+        
+        // 5. Check and manage existing positions using their stop loss and take profit levels
+        await this.managePositions();
+        
+        // 6. Log current state
+        this.logCurrentState(klingerResult, signalData);
+      } catch (error) {
+        console.error('Error calculating Klinger Oscillator:', error.message);
+      }
+    } finally {
+      if (closeTime !== null) this.completeDecision(closeTime);
+    }
+  }
+
+  // Candles of periods that closed at or before closeTime are final and may
+  // enter the buffer (this also covers closes whose own cycle was coalesced)
+  beginDecision(closeTime) {
+    this.holdFrom = closeTime;
+    this.releaseHeldCandles();
+  }
+
+  // Let candles of the period that opened at closeTime into the buffer
+  completeDecision(closeTime) {
+    this.holdFrom = closeTime + this.getIntervalInMs();
+    this.releaseHeldCandles();
+  }
+
+  releaseHeldCandles() {
+    while (this.heldCandles.length > 0 && this.heldCandles[0].timestamp < this.holdFrom) {
+      this.ingestCandle(this.heldCandles.shift());
+    }
+  }
+
+  // Keep a candle of a period whose opening close is not decided yet out of the
+  // buffer; returns true if it was held
+  holdCandle(candle) {
+    if (this.holdFrom === null || candle.timestamp < this.holdFrom) return false;
+    
+    const held = this.heldCandles;
+    if (held.length > 0 && held[held.length - 1].timestamp === candle.timestamp) {
+      held[held.length - 1] = candle;
+    } else {
+      held.push(candle);
+    }
+    return true;
+  }
+
+  // Ingest a candle unless it has to wait for a decision; returns true if ingested
+  receiveCandle(candle) {
+    if (this.holdCandle(candle)) return false;
+    this.ingestCandle(candle);
+    return true;
+  }
+
+  async updateLatestData(closeTime = null) {
+    // Fetch the latest candle
+    const latestCandles = await this.fetchCandlestickData(2); // Get 2 most recent candles
+    
+    // A stream backfill is in flight; let it apply the candles in order
+    if (this.backfilling) return;
+    
+    // Candles are missing between our newest and the ones returned; fill the hole first
+    if (this.candles.length > 0 && latestCandles.length > 0 &&
+        latestCandles[0][0] > this.candles.last('timestamp') + this.getIntervalInMs()) {
+      await this.backfillGap(closeTime);
+      return;
+    }
+    
+    // In order: the first refreshes our newest candle with its final values
+    // (O(1) update), the second is appended. A candle that opened at or after
+    // the scheduled close is left out so the decision sees the closed candle.
+    for (const raw of latestCandles) {
+      if (closeTime !== null && raw[0] >= closeTime) continue;
+      this.ingestCandle(parseCandle(raw));
+    }
+  }
+
+  get streamName() {
+    return `${this.symbol.toLowerCase()}@kline_${this.interval}`;
+  }
+
+  startStream() {
+    this.stream = new KlineStream(this.streamBaseUrl, [this], {
+      reconnectDelayMs: this.reconnectDelayMs,
+      maxReconnectDelayMs: this.maxReconnectDelayMs,
+      staleTimeoutMs: this.streamStaleTimeoutMs
+    });
+    this.stream.connect();
+  }
+
+  stopStream() {
+    if (this.stream) {
+      this.stream.close();
+      this.stream = null;
+    }
+  }
+
+  // Called by KlineStream on every (re)connect. The stream only counts as
+  // connected (and REST polling stops) once the gap is filled; if the backfill
+  // keeps failing this rejects, and this bot keeps polling REST and retries the
+  // backfill on its own timer while the shared socket stays up.
+  async onStreamOpen() {
+    clearTimeout(this.backfillRetryTimer);
+    this.backfillRetries = 0;
+    await this.syncStream(this.streamGeneration);
+  }
+
+  async syncStream(generation) {
+    // Hold pushed candles until the gap since our last candle is filled, so the
+    // backfilled (older) candles are not rejected as stale
+    this.backfilling = true;
+    try {
+      await this.backfillWithRetry();
+    } catch (error) {
+      // Held candles would be appended across the hole; the next backfill covers them
+      this.pendingStreamCandles = [];
+      this.scheduleBackfillRetry(generation, error);
+      throw error;
+    } finally {
+      this.backfilling = false;
+    }
+    
+    const pending = this.pendingStreamCandles;
+    this.pendingStreamCandles = [];
+    for (const candle of pending) {
+      this.receiveCandle(candle);
+    }
+    this.streamConnected = generation === this.streamGeneration;
+  }
+
+  async backfillWithRetry() {
+    for (let attempt = 1; ; attempt++) {
+      try {
+        await this.backfillGap();
+        return;
+      } catch (error) {
+        console.error(`Error backfilling candle gap for ${this.symbol} (attempt ${attempt}/${this.backfillAttempts}):`, error.message);
+        if (attempt >= this.backfillAttempts) throw error;
+        await new Promise(resolve => setTimeout(resolve, this.reconnectDelayMs * 2 ** (attempt - 1)));
+      }
+    }
+  }
+
+  scheduleBackfillRetry(generation, error) {
+    const delay = Math.min(this.reconnectDelayMs * 2 ** this.backfillRetries, this.maxReconnectDelayMs);
+    this.backfillRetries++;
+    console.error(`Giving up backfill for ${this.symbol}, polling REST and retrying in ${delay}ms:`, error.message);
+    
+    this.backfillRetryTimer = setTimeout(() => {
+      // A reconnect in the meantime runs its own backfill
+      if (generation !== this.streamGeneration) return;
+      this.syncStream(generation).catch(() => {});
+    }, delay);
+  }
+
+  onStreamClose() {
+    this.streamConnected = false;
+    this.streamGeneration++;
+    clearTimeout(this.backfillRetryTimer);
+  }
+
+  onStreamCandle(candle) {
+    if (this.backfilling) {
+      this.pendingStreamCandles.push(candle);
+      return;
+    }
+    
+    // Not caught up since the last (re)connect: REST polling covers this period
+    // until the retried backfill succeeds, and appending here would skip the hole
+    if (!this.streamConnected) return;
+    
+    // A new period waits until the close before it has been decided
+    if (!this.receiveCandle(candle)) return;
+    
+    // Check stop loss / take profit on every pushed tick; cheap when nothing is crossed
+    if (this.positions.size > 0) {
+      this.managePositions().catch(error => {
+        console.error('Error managing positions:', error.message);
+      });
+    }
+  }
+
+  // Fetch candles missed while disconnected through the REST endpoint. When called
+  // from a scheduled cycle, candles opening at or after closeTime are left out
+  // so the decision is taken on the closed candle.
+  async backfillGap(closeTime = null) {
+    if (this.candles.length === 0) {
+      await this.loadHistoricalData(closeTime);
+      return;
+    }
+    
+    const lastTimestamp = this.candles.last('timestamp');
+    // +1 so the last candle we hold is refreshed with its final values
+    const missing = Math.ceil((this.exchangeNow() - lastTimestamp) / this.getIntervalInMs()) + 1;
+    
+    if (missing >= this.candles.capacity) {
+      await this.loadHistoricalData(closeTime);
+      return;
+    }
+    
+    const response = await this.fetchCandlestickData(Math.max(missing, 2));
+    for (const raw of response) {
+      if (closeTime !== null && raw[0] >= closeTime) continue;
+      if (raw[0] >= lastTimestamp) {
+        this.receiveCandle(parseCandle(raw));
       }
     }
   }
 
-  async fetchCandlestickData(limit) {
+  async fetchCandlestickData(limit, interval = this.interval, { startTime, endTime } = {}) {
     // Implementation depends on exchange
     // This example is for Binance
     try {
-      const response = await axios.get(`https://api.binance.com/api/v3/klines`, {
+      const request = () => this.http.get(`${this.restBaseUrl}/api/v3/klines`, {
         params: {
           symbol: this.symbol,
-          interval: this.interval,
-          limit: limit
+          interval: interval,
+          limit: limit,
+          startTime: startTime,
+          endTime: endTime
         }
       });
       
+      const response = this.rateLimiter
+        ? await this.rateLimiter.schedule(klineRequestWeight(limit), request)
+        : await request();
+      
       return response.data;
     } catch (error) {
       console.error('Error fetching candlestick data:', error.message);
@@ -182,7 +1448,7 @@ class CryptoTradingBot {
         if (positionSize <= 0) return;
         
         // Get current price
-        const currentPrice = this.historicalData[this.historicalData.length - 1].close;
+        const currentPrice = this.candles.last('close');
         
         // Calculate stop loss and take profit levels
         const stopLoss = currentPrice * (1 - this.stopLossPercent);
@@ -192,14 +1458,14 @@ class CryptoTradingBot {
         const order = await this.placeBuyOrder(positionSize);
         
         // Track this position
-        this.positions.push({
+        this.positions.add({
           id: order.orderId,
           symbol: this.symbol,
           entryPrice: currentPrice,
           quantity: positionSize,
           stopLoss: stopLoss,
           takeProfit: takeProfit,
-          timestamp: Date.now()
+          timestamp: this.exchangeNow()
         });
         
         console.log(`Buy order placed for ${positionSize} ${this.symbol} at ${currentPrice}`);
@@ -207,14 +1473,9 @@ class CryptoTradingBot {
       } 
       else if (signal === 'SELL') {
         // Check if we have any open positions
-        if (this.positions.length > 0) {
+        if (this.positions.size > 0) {
           // Close all positions
-          for (let position of this.positions) {
-            await this.placeSellOrder(position.quantity);
-            console.log(`Sold ${position.quantity} ${this.symbol} based on sell signal`);
-          }
-          
-          this.positions = [];
+          await this.closePositions(this.positions.takeAll(), 'sell signal');
         } else {
           // Option: You could implement short selling here
           console.log('No open positions to sell. Ignoring sell signal.');
@@ -226,41 +1487,43 @@ class CryptoTradingBot {
   }
 
   async managePositions() {
-    if (this.positions.length === 0) return;
+    if (this.positions.size === 0) return;
     
-    const currentPrice = this.historicalData[this.historicalData.length - 1].close;
-    const positionsToClose = [];
+    const currentPrice = this.candles.last('close');
+    const triggered = this.positions.popTriggered(currentPrice);
+    if (triggered.length === 0) return;
     
-    // Check each position for stop loss or take profit
-    for (let i = 0; i < this.positions.length; i++) {
-      const position = this.positions[i];
-      
-      if (currentPrice <= position.stopLoss) {
-        console.log(`Stop loss triggered for position ${position.id} at ${currentPrice}`);
-        positionsToClose.push(i);
-      } 
-      else if (currentPrice >= position.takeProfit) {
-        console.log(`Take profit triggered for position ${position.id} at ${currentPrice}`);
-        positionsToClose.push(i);
-      }
+    for (const { position, reason } of triggered) {
+      console.log(`${reason === 'stop loss' ? 'Stop loss' : 'Take profit'} triggered for position ${position.id} at ${currentPrice}`);
     }
     
-    // Close triggered positions
-    for (let i = positionsToClose.length - 1; i >= 0; i--) {
-      const position = this.positions[positionsToClose[i]];
-      try {
-        await this.placeSellOrder(position.quantity);
-        console.log(`Closed position ${position.id}: ${position.quantity} ${this.symbol}`);
-        this.positions.splice(positionsToClose[i], 1);
-      } catch (error) {
-        console.error(`Error closing position ${position.id}:`, error.message);
+    await this.closePositions(triggered.map(({ position }) => position), 'stop loss / take profit');
+  }
+
+  // Submit sell orders concurrently; positions whose order fails are put back in the book
+  async closePositions(positions, reason) {
+    const results = await settleWithConcurrency(
+      positions,
+      this.orderConcurrency,
+      position => this.placeSellOrder(position.quantity)
+    );
+    
+    results.forEach((result, i) => {
+      const position = positions[i];
+      if (result.status === 'fulfilled') {
+        console.log(`Closed position ${position.id}: ${position.quantity} ${this.symbol} (${reason})`);
+      } else {
+        console.error(`Error closing position ${position.id}:`, result.reason.message);
+        this.positions.add(position);
       }
-    }
+    });
+    
+    return results;
   }
 
   calculatePositionSize(balance) {
     // Implement your position sizing logic with risk management
-    const currentPrice = this.historicalData[this.historicalData.length - 1].close;
+    const currentPrice = this.candles.last('close');
     const availableFunds = balance * this.maxPositionSize;
     
     // Calculate quantity based on available funds and current price
@@ -283,12 +1546,16 @@ class CryptoTradingBot {
   }
 
   async getAvailableBalance() {
+    if (this.exchangeSimulator) return this.exchangeSimulator.getBalance();
+    
     // In a real implementation, you would fetch this from the exchange API
     // This is a placeholder for demonstration
     return 1000; // Simulate having 1000 USDT available
   }
 
   async placeBuyOrder(quantity) {
+    if (this.exchangeSimulator) return this.exchangeSimulator.placeOrder(this.symbol, 'BUY', quantity);
+    
     // In a real implementation, you would make an API call to the exchange
     // This is a placeholder
     console.log(`[SIMULATION] Placing buy order for ${quantity} ${this.symbol}`);
@@ -302,6 +1569,8 @@ class CryptoTradingBot {
   }
 
   async placeSellOrder(quantity) {
+    if (this.exchangeSimulator) return this.exchangeSimulator.placeOrder(this.symbol, 'SELL', quantity);
+    
     // In a real implementation, you would make an API call to the exchange
     // This is a placeholder
     console.log(`[SIMULATION] Placing sell order for ${quantity} ${this.symbol}`);
@@ -315,7 +1584,9 @@ class CryptoTradingBot {
   }
 
   logCurrentState(klingerResult) {
-    const latestData = this.historicalData[this.historicalData.length - 1];
+    if (!this.logState) return;
+    
+    const latestData = this.candles.latest();
     const latestKlinger = klingerResult.klingerOscillator[klingerResult.klingerOscillator.length - 1];
     const latestSignal = klingerResult.signalLine[klingerResult.signalLine.length - 1];
     const latestHistogram = klingerResult.histogram[klingerResult.histogram.length - 1];
@@ -326,22 +1597,320 @@ class CryptoTradingBot {
     console.log(`Klinger Oscillator: ${latestKlinger.toFixed(2)}`);
     console.log(`Signal Line: ${latestSignal.toFixed(2)}`);
     console.log(`Histogram: ${latestHistogram.toFixed(2)}`);
+    for (const timeframe of this.timeframes) {
+      const klinger = timeframe.klingerState.result();
+      if (!timeframe.ready) {
+        console.log(`${timeframe.interval} Klinger: warming up (${klinger.length}/${timeframe.minDataPoints} candles)`);
+        continue;
+      }
+      console.log(`${timeframe.interval} Klinger: ${klinger.klingerOscillator[klinger.length - 1].toFixed(2)}, Histogram: ${klinger.histogram[klinger.length - 1].toFixed(2)}`);
+    }
     console.log(`Last Signal: ${this.lastSignal || 'NONE'}`);
-    console.log(`Open Positions: ${this.positions.length}`);
+    console.log(`Open Positions: ${this.positions.size}`);
     console.log('----------------------');
   }
 
   getIntervalInMs() {
-    // Convert interval string to milliseconds
-    const unit = this.interval.slice(-1);
-    const value = parseInt(this.interval.slice(0, -1));
+    return intervalToMs(this.interval);
+  }
+}
+
+// Runs many symbols in one process: one shared keep-alive HTTP client, one
+// token-bucket request scheduler, one combined kline stream and one timer per
+// interval instead of one of each per bot.
+class CryptoTradingBotHost {
+  constructor(config) {
+    const http = require('http');
+    const https = require('https');
+    
+    this.http = config.httpClient || axios.create({
+      httpAgent: new http.Agent({ keepAlive: true, maxSockets: config.maxSockets || 10 }),
+      httpsAgent: new https.Agent({ keepAlive: true, maxSockets: config.maxSockets || 10 })
+    });
+    
+    // Binance allows 6000 request weight per minute per IP; stay well below it by default
+    const weightPerMinute = config.requestWeightPerMinute || 1200;
+    this.rateLimiter = config.rateLimiter || new TokenBucket({
+      capacity: config.requestBurst || 100,
+      refillPerSecond: weightPerMinute / 60
+    });
+    
+    this.dataMode = config.dataMode || 'rest';
+    this.streamBaseUrl = config.streamBaseUrl || 'wss://stream.binance.com:9443';
+    this.stream = null;
+    this.schedulers = [];
+    
+    // Per-symbol overrides go in config.symbolConfig[symbol]
+    this.bots = config.symbols.map(symbol => new CryptoTradingBot({
+      ...config,
+      ...(config.symbolConfig && config.symbolConfig[symbol]),
+      symbol,
+      httpClient: this.http,
+      rateLimiter: this.rateLimiter
+    }));
+  }
+
+  async start() {
+    console.log(`Starting Klinger Oscillator trading host for ${this.bots.length} symbols...`);
+    
+    // Initial data load; the shared rate limiter spreads these requests
+    const loaded = await Promise.all(this.bots.map(async bot => {
+      try {
+        await bot.loadHistoricalData();
+        return bot;
+      } catch (error) {
+        console.error(`Failed to load historical data for ${bot.symbol}:`, error.message);
+        return null;
+      }
+    }));
+    const active = loaded.filter(Boolean);
+    
+    if (this.dataMode === 'stream' && active.length > 0) {
+      this.stream = new KlineStream(this.streamBaseUrl, active, {
+        reconnectDelayMs: active[0].reconnectDelayMs,
+        maxReconnectDelayMs: active[0].maxReconnectDelayMs,
+        staleTimeoutMs: active[0].streamStaleTimeoutMs
+      });
+      this.stream.connect();
+    }
+    
+    if (active.length === 0) return;
+    
+    // All bots talk to the same exchange, so one clock sync serves them all
+    const clockOffsetMs = await active[0].syncExchangeClock();
+    for (const bot of active) {
+      bot.clockOffsetMs = clockOffsetMs;
+    }
+    
+    // One candle-close-aligned check per distinct interval
+    const groups = new Map();
+    for (const bot of active) {
+      const intervalMs = bot.getIntervalInMs();
+      if (!groups.has(intervalMs)) groups.set(intervalMs, []);
+      groups.get(intervalMs).push(bot);
+    }
+    
+    for (const [intervalMs, bots] of groups) {
+      this.schedulers.push(new CandleCloseScheduler({
+        intervalMs,
+        offsetMs: bots[0].cycleOffsetMs,
+        now: () => bots[0].exchangeNow(),
+        task: closeTime => this.runCycle(bots, closeTime)
+      }));
+    }
+    
+    for (const scheduler of this.schedulers) {
+      scheduler.start();
+    }
+    
+    // Initial check
+    await Promise.all(this.schedulers.map(scheduler => scheduler.runNow()));
+  }
+
+  async runCycle(bots, closeTime = null) {
+    await Promise.all(bots.map(async bot => {
+      try {
+        await bot.checkAndTrade(closeTime);
+      } catch (error) {
+        console.error(`Error in trading cycle for ${bot.symbol}:`, error.message);
+      }
+    }));
+  }
+
+  stop() {
+    for (const scheduler of this.schedulers) {
+      scheduler.stop();
+    }
+    this.schedulers = [];
+    if (this.stream) {
+      this.stream.close();
+      this.stream = null;
+    }
+  }
+}
+
+// Fills market orders at the latest replayed close (plus slippage and fees)
+// and keeps cash, holdings and realized PnL per symbol
+class ReplayExchange {
+  constructor({ initialBalance = 1000, feeRate = 0.001, slippage = 0.0005 } = {}) {
+    this.initialBalance = initialBalance;
+    this.cash = initialBalance;
+    this.feeRate = feeRate;
+    this.slippage = slippage;
+    this.prices = new Map();
+    this.accounts = new Map(); // symbol -> { quantity, costBasis, realizedPnl, fees, trades }
+    this.nextOrderId = 0;
+  }
+
+  account(symbol) {
+    let account = this.accounts.get(symbol);
+    if (!account) {
+      account = { quantity: 0, costBasis: 0, realizedPnl: 0, fees: 0, trades: 0 };
+      this.accounts.set(symbol, account);
+    }
+    return account;
+  }
+
+  setPrice(symbol, price) {
+    this.prices.set(symbol, price);
+  }
+
+  getBalance() {
+    return this.cash;
+  }
+
+  placeOrder(symbol, side, quantity) {
+    const marketPrice = this.prices.get(symbol);
+    if (marketPrice === undefined) {
+      throw new Error(`No replay price for ${symbol}`);
+    }
+    
+    const account = this.account(symbol);
+    const price = marketPrice * (side === 'BUY' ? 1 + this.slippage : 1 - this.slippage);
+    const notional = price * quantity;
+    const fee = notional * this.feeRate;
+    
+    if (side === 'BUY') {
+      if (notional + fee > this.cash) {
+        throw new Error(`Insufficient balance for ${quantity} ${symbol}`);
+      }
+      this.cash -= notional + fee;
+      account.quantity += quantity;
+      account.costBasis += notional + fee;
+    } else {
+      if (quantity > account.quantity + 1e-12) {
+        throw new Error(`Insufficient ${symbol} holdings to sell ${quantity}`);
+      }
+      const cost = account.quantity > 0 ? account.costBasis * (quantity / account.quantity) : 0;
+      this.cash += notional - fee;
+      account.quantity -= quantity;
+      account.costBasis -= cost;
+      account.realizedPnl += notional - fee - cost;
+    }
+    
+    account.fees += fee;
+    account.trades++;
+    
+    return {
+      orderId: `replay-${++this.nextOrderId}`,
+      status: 'FILLED',
+      executedQty: quantity,
+      price
+    };
+  }
+
+  report() {
+    const symbols = {};
+    let equity = this.cash;
+    let fees = 0;
+    let trades = 0;
     
-    switch (unit) {
-      case 'm': return value * 60 * 1000;
-      case 'h': return value * 60 * 60 * 1000;
-      case 'd': return value * 24 * 60 * 60 * 1000;
-      default: return 60 * 1000; // default to 1 minute
+    for (const [symbol, account] of this.accounts) {
+      const marketValue = account.quantity * (this.prices.get(symbol) || 0);
+      equity += marketValue;
+      fees += account.fees;
+      trades += account.trades;
+      symbols[symbol] = {
+        trades: account.trades,
+        holdings: account.quantity,
+        realizedPnl: account.realizedPnl,
+        unrealizedPnl: marketValue - account.costBasis,
+        fees: account.fees
+      };
     }
+    
+    return {
+      initialBalance: this.initialBalance,
+      finalEquity: equity,
+      pnl: equity - this.initialBalance,
+      returnPct: (equity / this.initialBalance - 1) * 100,
+      trades,
+      fees,
+      symbols
+    };
+  }
+}
+
+// Drives checkAndTrade from stored klines on a virtual clock, as fast as the
+// CPU allows. config.klines (or the JSON file at config.file) maps each symbol
+// to its klines in the REST response format, oldest first.
+class CryptoTradingBotReplay {
+  constructor(config) {
+    const klines = config.klines || JSON.parse(require('fs').readFileSync(config.file, 'utf8'));
+    
+    this.now = 0;
+    this.exchange = new ReplayExchange({
+      initialBalance: config.initialBalance,
+      feeRate: config.feeRate,
+      slippage: config.slippage
+    });
+    
+    this.feeds = Object.keys(klines).map(symbol => {
+      const bot = new CryptoTradingBot({
+        ...config,
+        ...(config.symbolConfig && config.symbolConfig[symbol]),
+        symbol,
+        dataMode: 'replay',
+        clock: () => this.now,
+        exchangeSimulator: this.exchange,
+        logState: false
+      });
+      return {
+        bot,
+        klines: klines[symbol],
+        next: 0,
+        intervalMs: bot.getIntervalInMs(),
+        warmup: config.warmupCandles !== undefined ? config.warmupCandles : bot.minDataPoints
+      };
+    });
+  }
+
+  // Feed whose next candle closes first (k-way merge across symbols). Ordering by
+  // close time keeps the virtual clock monotonic when intervals differ.
+  nextFeed() {
+    let earliest = null;
+    let earliestClose = Infinity;
+    for (const feed of this.feeds) {
+      if (feed.next >= feed.klines.length) continue;
+      const closeTime = feed.klines[feed.next][0] + feed.intervalMs;
+      if (closeTime < earliestClose) {
+        earliest = feed;
+        earliestClose = closeTime;
+      }
+    }
+    return earliest;
+  }
+
+  async run() {
+    const startedAt = Date.now();
+    let candles = 0;
+    let cycles = 0;
+    
+    for (let feed = this.nextFeed(); feed; feed = this.nextFeed()) {
+      const candle = parseCandle(feed.klines[feed.next++]);
+      const { bot } = feed;
+      
+      // The decision for a candle is taken when it closes
+      this.now = candle.timestamp + feed.intervalMs;
+      bot.ingestCandle(candle);
+      this.exchange.setPrice(bot.symbol, candle.close);
+      candles++;
+      
+      if (feed.next > feed.warmup) {
+        await bot.checkAndTrade();
+        cycles++;
+      }
+    }
+    
+    const wallTimeMs = Date.now() - startedAt;
+    return {
+      pairs: this.feeds.length,
+      candles,
+      cycles,
+      wallTimeMs,
+      candlesPerSecond: candles / Math.max(wallTimeMs, 1) * 1000,
+      ...this.exchange.report()
+    };
   }
 }
 
@@ -356,16 +1925,44 @@ const runBot = async () => {
     klingerShortPeriod: 34,
     klingerLongPeriod: 55,
     klingerSignalPeriod: 13,
+    timeframes: ['4h', '1d'], // Higher timeframes built from the hourly candles
     maxPositionSize: 0.1, // Use maximum 10% of available balance per trade
     stopLossPercent: 0.03, // 3% stop loss
-    takeProfitPercent: 0.06 // 6% take profit
+    takeProfitPercent: 0.06, // 6% take profit
+    dataMode: 'stream' // Push kline updates over a websocket instead of polling REST
   });
 
   await bot.start();
 };
 
-runBot().catch(error => {
-  console.error('Error running bot:', error.message);
-});
+// Replay example: node <this file> --replay klines.json
+const runReplay = async file => {
+  const replay = new CryptoTradingBotReplay({
+    file,
+    interval: '1h',
+    maxPositionSize: 0.1,
+    stopLossPercent: 0.03,
+    takeProfitPercent: 0.06,
+    initialBalance: 1000
+  });
+
+  const report = await replay.run();
+  console.log('---- Replay Report ----');
+  console.log(`Pairs: ${report.pairs}, Candles: ${report.candles}, Cycles: ${report.cycles}`);
+  console.log(`Wall time: ${report.wallTimeMs}ms (${Math.round(report.candlesPerSecond)} candles/s)`);
+  console.log(`Trades: ${report.trades}, Fees: ${report.fees.toFixed(2)}`);
+  console.log(`Final equity: ${report.finalEquity.toFixed(2)}, PnL: ${report.pnl.toFixed(2)} (${report.returnPct.toFixed(2)}%)`);
+  console.log('-----------------------');
+};
+
+if (require.main === module) {
+  const replayIndex = process.argv.indexOf('--replay');
+  const run = replayIndex >= 0 ? runReplay(process.argv[replayIndex + 1]) : runBot();
+  run.catch(error => {
+    console.error('Error running bot:', error.message);
+  });
+}
 
-module.exports = CryptoTradingBot;
\ No newline at end of file
+module.exports = CryptoTradingBot;
+module.exports.CryptoTradingBotHost = CryptoTradingBotHost;
+module.exports.CryptoTradingBotReplay = CryptoTradingBotReplay;
\ No newline at end of file